@@ -1,11 +1,119 @@
 import time
 import random
 import heapq
+import weakref
+import multiprocessing as mp
+from multiprocessing import shared_memory
 from math import sqrt, log
 from board import HexBoard
 
+try:
+    import numpy as np
+except ImportError:  # Sólo hace falta para el evaluador con red
+    np = None
+
 # Direcciones válidas en Hex
 DIRS = [(0, -1), (0, 1), (-1, 0), (1, 0), (-1, 1), (1, -1)]
+
+# Simetrías del tablero: 0 identidad, 1 giro de 180°, 2 transpuesta con
+# cambio de colores (y de turno), 3 giro + transpuesta. Todas son involuciones.
+SIMETRIAS = (0, 1, 2, 3)
+_CAMBIO_COLOR = (0, 2, 1)
+
+# Valores por defecto de la constante de exploración PUCT (sólo con evaluador
+# de red) y del sesgo supuesto de AMAF en la mezcla RAVE de mínimo error
+# cuadrático. Cada HexPlayer los copia en c_puct y sesgo_rave.
+C_PUCT = 1.5
+SESGO_RAVE = 0.05
+
+def transformar_casilla(casilla, simetria, tam):
+    """Aplica una simetría a una casilla (la inversa es la misma simetría)"""
+    r, c = casilla
+    if simetria & 1:
+        r, c = tam - 1 - r, tam - 1 - c
+    if simetria & 2:
+        r, c = c, r
+    return (r, c)
+
+_ZOBRIST = {}
+
+def _tabla_zobrist(tam):
+    """Códigos de 64 bits por casilla y color, fijos para cada tamaño.
+    El primero es el hash del tablero vacío, distinto para cada tamaño."""
+    tabla = _ZOBRIST.get(tam)
+    if tabla is None:
+        rng = random.Random(tam)
+        vacio = rng.getrandbits(64)
+        tabla = (vacio, [(0, rng.getrandbits(64), rng.getrandbits(64)) for _ in range(tam * tam)])
+        _ZOBRIST[tam] = tabla
+    return tabla
+
+def codigo_zobrist(casilla, color, simetria, tam):
+    """Código de una ficha en la posición vista bajo una simetría"""
+    r, c = transformar_casilla(casilla, simetria, tam)
+    if simetria & 2:
+        color = 3 - color
+    return _tabla_zobrist(tam)[1][r * tam + c][color]
+
+def simetrias_turno(jugador):
+    """Simetrías que dejan como jugador en turno al 1"""
+    return (0, 1) if jugador == 1 else (2, 3)
+
+def hash_canonico(celdas, jugador):
+    """Retorna (hash, simetria): el menor hash Zobrist entre las posiciones
+    simétricas en las que mueve el jugador 1 (el turno queda implícito)"""
+    tam = len(celdas)
+    hashes = dict.fromkeys(simetrias_turno(jugador), _tabla_zobrist(tam)[0])
+    for r, fila in enumerate(celdas):
+        for c, v in enumerate(fila):
+            if v:
+                for s in hashes:
+                    hashes[s] ^= codigo_zobrist((r, c), v, s, tam)
+    return min((h, s) for s, h in hashes.items())
+
+def _clave_transformada(celdas, jugador, simetria):
+    """Clave (jugador en turno, casillas) del tablero visto bajo una simetría"""
+    if simetria & 2:
+        tam = len(celdas)
+        planas = [_CAMBIO_COLOR[celdas[c][r]] for r in range(tam) for c in range(tam)]
+        jugador = 3 - jugador
+    else:
+        planas = [v for fila in celdas for v in fila]
+    if simetria & 1:
+        planas.reverse()  # El giro de 180° invierte el orden por filas
+    return (jugador, tuple(planas))
+
+def simetrias_propias(celdas):
+    """Simetrías (sin contar la identidad) que dejan igual la posición y el turno.
+    Sólo puede serlo el giro de 180°: las transpuestas cambian el jugador en turno."""
+    planas = [v for fila in celdas for v in fila]
+    return [1] if planas == planas[::-1] else []
+
+def _cell_mask(size, cells):
+    """Conjunto de casillas: arreglo booleano con NumPy, entero de bits sin él"""
+    if np is not None:
+        mask = np.zeros(size * size, dtype=bool)
+        mask[cells] = True
+        return mask
+    bits = 0
+    for i in cells:
+        bits |= 1 << i
+    return bits
+
+def _without_cell(mask, i):
+    if np is not None:
+        mask = mask.copy()
+        mask[i] = False
+        return mask
+    return mask & ~(1 << i)
+
+def _with_cell(mask, i):
+    """Añade una casilla; el arreglo de NumPy se modifica en el sitio"""
+    if np is not None:
+        mask[i] = True
+        return mask
+    return mask | (1 << i)
+
 class Player:
     def __init__(self, player_id: int):
         self.player_id = player_id  # Tu identificador (1 o 2)
@@ -22,29 +130,56 @@ class Node:
         self.children = []
         self.wins = 0
         self.visits = 0
-        # Estadísticas AMAF/RAVE
-        self.amaf_stats = {}
+        # Estadísticas AMAF/RAVE: arreglos por casilla (r*size+c), creados al primer uso
+        self.amaf_wins = None
+        self.amaf_visits = None
+        # Casillas vacías: arreglo booleano con NumPy, entero de bits sin él
+        if parent is None:
+            self.empty_mask = _cell_mask(board.size, [r * board.size + c
+                                                      for r, c in board.get_possible_moves()])
+        else:
+            self.empty_mask = _without_cell(parent.empty_mask, move[0] * board.size + move[1])
         # Valor posicional
         self.pos_value = None
+        # Jugadas aún sin hijo (se calcula en la primera expansión)
+        self.untried = None
+        # Política de la red para este nodo y prior de su jugada (PUCT)
+        self.policy = None
+        self.prior = None
+        # Hoja en un lote del evaluador: no se expande hasta tener su política
+        self.pending = False
+
+    def uct_value(self, explore_param=1.4, c_puct=None, rave_bias=None):
+        if c_puct is None:
+            c_puct = C_PUCT
+        if rave_bias is None:
+            rave_bias = SESGO_RAVE
+
+        if self.prior is not None:
+            # PUCT: la exploración la guía el prior de la red
+            exploit = self.wins / self.visits if self.visits else 0.5
+            return exploit + c_puct * self.prior * sqrt(self.parent.visits) / (1 + self.visits)
 
-    def uct_value(self, explore_param=1.4):
         if self.visits == 0:
             return float('inf')
         
         # RAVE stats
         amaf_wins, amaf_visits = (0, 0)
         if self.parent and self.move:
-            amaf_wins, amaf_visits = self.parent.amaf_stats.get(self.move, (0, 0))
+            amaf_wins, amaf_visits = self.parent.amaf(self.move)
         
         # UCT clásico
         exploit = self.wins / self.visits
         
-        # Factor de mezcla RAVE (más bajo con más visitas)
-        k = 1000  # Parámetro de descuento
-        beta = sqrt(k / (3 * self.visits + k))
+        # Factor de mezcla RAVE de mínimo error cuadrático (Gelly y Silver, 2011):
+        # crece con las visitas AMAF y baja con las propias según el sesgo
+        beta = 0.0
+        if amaf_visits > 0:
+            beta = amaf_visits / (self.visits + amaf_visits
+                                  + 4 * rave_bias ** 2 * self.visits * amaf_visits)
         
         # Valor RAVE 
-        amaf_val = amaf_wins / (amaf_visits + 1e-6) if amaf_visits > 0 else 0.5
+        amaf_val = amaf_wins / amaf_visits if amaf_visits > 0 else 0.5
         
         # Exploración UCT
         explore = explore_param * sqrt(log(self.parent.visits) / self.visits) if self.parent else 0
@@ -52,18 +187,110 @@ class Node:
         # Mezcla ponderada UCT y RAVE
         return (1 - beta) * exploit + beta * amaf_val + explore
 
-    def select(self):
-        if not self.children:
+    def select(self, c_puct=None, rave_bias=None):
+        # Sin política se desciende sólo por nodos completamente expandidos
+        if self.pending or not self.children or self.untried is None \
+                or (self.untried and self.policy is None):
             return self
-        return max(self.children, key=lambda c: c.uct_value()).select()
+        if c_puct is None:
+            c_puct = C_PUCT
+        best_value, best = max(((c.uct_value(c_puct=c_puct, rave_bias=rave_bias), c)
+                                for c in self.children), key=lambda par: par[0])
+        # Con política, la mejor jugada sin probar compite con los hijos por su prior
+        if self.untried:
+            prior = self.policy.get(self.untried[0], 0.0)
+            if 0.5 + c_puct * prior * sqrt(self.visits) >= best_value:
+                return self
+        return best.select(c_puct, rave_bias)
+
+    def set_policy(self, policy):
+        """Asigna la política de la red y ordena las jugadas sin probar por prior"""
+        self.policy = policy
+        if self.untried:
+            self.untried.sort(key=lambda m: policy.get(m, 0.0), reverse=True)
+
+    def add_virtual_loss(self, amount):
+        """Suma (o retira) visitas sin victorias en el camino hasta la raíz"""
+        node = self
+        while node:
+            node.visits += amount
+            node = node.parent
+
+    def _amaf_arrays(self):
+        if self.amaf_wins is None:
+            cells = self.board.size * self.board.size
+            if np is not None:
+                self.amaf_wins = np.zeros(cells)
+                self.amaf_visits = np.zeros(cells)
+            else:
+                self.amaf_wins = [0.0] * cells
+                self.amaf_visits = [0] * cells
+        return self.amaf_wins, self.amaf_visits
+
+    def _add_amaf(self, owned, cells, result):
+        """Suma un resultado a las jugadas (owned / cells) legales en este nodo"""
+        wins, visits = self._amaf_arrays()
+        if np is not None:
+            # Una pasada vectorizada por nodo
+            legal = owned & self.empty_mask
+            wins[legal] += result
+            visits[legal] += 1
+        else:
+            empty = self.empty_mask
+            for i in cells:
+                if empty >> i & 1:
+                    wins[i] += result
+                    visits[i] += 1
+
+    def amaf(self, move):
+        """(victorias, visitas) AMAF de una jugada hecha desde este nodo"""
+        if self.amaf_wins is None:
+            return (0, 0)
+        i = move[0] * self.board.size + move[1]
+        return self.amaf_wins[i], self.amaf_visits[i]
+
+    def seed_amaf(self, move, wins, visits):
+        """Fija estadísticas AMAF previas para una jugada"""
+        amaf_wins, amaf_visits = self._amaf_arrays()
+        i = move[0] * self.board.size + move[1]
+        amaf_wins[i], amaf_visits[i] = wins, visits
+
+    def _representative_moves(self, moves):
+        """Descarta jugadas equivalentes por el giro de 180° (sólo en la raíz)"""
+        if self.parent is not None:
+            return moves
+        simetrias = simetrias_propias(self.board.board)
+        if not simetrias:
+            return moves
+        sz = self.board.size
+        return [m for m in moves
+                if all(m <= transformar_casilla(m, s, sz) for s in simetrias)]
 
     def expand(self):
-        tried = {c.move for c in self.children}
-        possible = [m for m in self.board.get_possible_moves() if m not in tried]
-        
+        if self.untried is None:
+            self.untried = self._representative_moves(self.board.get_possible_moves())
+            if self.policy is not None:
+                self.set_policy(self.policy)
+        possible = self.untried
+
         if not possible:
             return self
-        
+
+        if self.policy is not None:
+            move = possible.pop(0)  # Mayor prior primero
+        else:
+            move = self._heuristic_move(possible)
+            possible.remove(move)
+
+        new_board = self.board.clone()
+        new_board.place_piece(*move, self.player_id)
+        child = Node(new_board, move, self, 3 - self.player_id)
+        if self.policy is not None:
+            child.prior = self.policy.get(move, 0.0)
+        self.children.append(child)
+        return child
+
+    def _heuristic_move(self, possible):
         # Evaluación posicional de movimientos
         scored = []
         sz = self.board.size
@@ -106,12 +333,7 @@ class Node:
             move = scored[idx][1]
         else:
             move = random.choice(scored)[1]
-        
-        new_board = self.board.clone()
-        new_board.place_piece(*move, self.player_id)
-        child = Node(new_board, move, self, 3 - self.player_id)
-        self.children.append(child)
-        return child
+        return move
 
     def simulate(self):
         sim_board = self.board.clone()
@@ -175,21 +397,33 @@ class Node:
             return 0.0, moves_played  # Derrota
 
     def backpropagate(self, result, moves_played):
-        self.visits += 1
-        self.wins += result
-        
-        # Actualiza AMAF stats en ancestros
-        if self.parent:
-            for (p, move) in moves_played:
-                # Solo actualiza si el jugador coincide con el que jugaría en este nodo
-                if p == self.player_id:
-                    # Actualiza si el movimiento sigue siendo legal en el padre
-                    if move in self.parent.board.get_possible_moves():
-                        w, v = self.parent.amaf_stats.get(move, (0, 0))
-                        self.parent.amaf_stats[move] = (w + result, v + 1)
-            
+        # result es para el jugador en turno; wins cuenta para quien hizo self.move
+        sz = self.board.size
+        # Casillas de cada jugador en la simulación (mismo formato que empty_mask)
+        cells = {1: [], 2: []}
+        for p, (r, c) in moves_played:
+            cells[p].append(r * sz + c)
+        owned = {p: _cell_mask(sz, cells[p]) for p in cells}
+
+        node = self
+        while node:
+            node.visits += 1
+            node.wins += 1 - result
+
+            # AMAF con las jugadas del jugador en turno
+            if cells[node.player_id]:
+                node._add_amaf(owned[node.player_id], cells[node.player_id], result)
+
+            if node.parent:
+                # La jugada del árbol también cuenta para los ancestros
+                r, c = node.move
+                p = node.parent.player_id
+                cells[p].append(r * sz + c)
+                owned[p] = _with_cell(owned[p], r * sz + c)
+
             # Retropropaga invirtiendo el resultado
-            self.parent.backpropagate(1 - result, moves_played)
+            node = node.parent
+            result = 1 - result
 
     def best_child(self):
         if not self.children:
@@ -198,43 +432,419 @@ class Node:
         # El hijo más visitado es más robusto
         return max(self.children, key=lambda c: c.visits)
 
+class EvaluadorCaido(RuntimeError):
+    """El evaluador dejó de responder; la búsqueda sigue con simulaciones"""
+
+class Evaluador:
+    """Interfaz de evaluación de hojas: política (priors) y valor por posición.
+
+    El evaluador es de quien lo crea: HexPlayer lo usa pero no lo cierra.
+    Se puede usar con `with` o llamar a cerrar() al terminar.
+    """
+    def __init__(self, tam: int, tam_lote: int = 1):
+        self.tam = tam  # Tamaño de tablero que acepta
+        self.tam_lote = tam_lote  # Hojas que conviene acumular por llamada
+
+    def evaluar(self, posiciones) -> list:
+        """Recibe [(tablero, jugador en turno)] y retorna [(politica, valor)].
+
+        politica: {jugada: probabilidad} sobre las casillas libres.
+        valor: probabilidad de ganar del jugador en turno (como Node.simulate).
+        """
+        raise NotImplementedError("¡Implementa este método!")
+
+    def cerrar(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.cerrar()
+
+def _cargar_modelo(ruta_modelo, tam):
+    """Carga el modelo y comprueba sus salidas con una entrada vacía"""
+    if ruta_modelo.endswith('.onnx'):
+        import onnxruntime as ort
+        sesion = ort.InferenceSession(ruta_modelo, providers=['CPUExecutionProvider'])
+        nombre = sesion.get_inputs()[0].name
+
+        def inferir(x):
+            politica, valor = sesion.run(None, {nombre: x})
+            return politica, valor
+    else:
+        # Perceptrón con una capa oculta guardado con np.savez
+        pesos = np.load(ruta_modelo)
+        W1, b1, Wp, bp, Wv, bv = (pesos[k] for k in ('W1', 'b1', 'Wp', 'bp', 'Wv', 'bv'))
+
+        def inferir(x):
+            h = np.maximum(x.reshape(len(x), -1) @ W1 + b1, 0)
+            return h @ Wp + bp, 1 / (1 + np.exp(-(h @ Wv + bv)))
+
+    politica, valor = inferir(np.zeros((1, 3, tam, tam), dtype=np.float32))
+    if np.shape(politica) != (1, tam * tam) or np.size(valor) != 1:
+        raise ValueError(f"salidas de forma {np.shape(politica)} y {np.shape(valor)}, "
+                         f"se esperaban (1, {tam * tam}) y (1, 1)")
+    return inferir
+
+def _servidor_red(nombre_entrada, nombre_salida, tam, tam_lote, ruta_modelo, conexion):
+    """Proceso evaluador: lee lotes de la memoria compartida y escribe política y valor"""
+    try:
+        inferir = _cargar_modelo(ruta_modelo, tam)
+    except Exception as error:  # Cualquier fallo de carga se informa al proceso principal
+        conexion.send(('error', f"{type(error).__name__}: {error}"))
+        return
+    conexion.send(('ok', None))
+
+    mem_entrada = shared_memory.SharedMemory(name=nombre_entrada)
+    mem_salida = shared_memory.SharedMemory(name=nombre_salida)
+    entrada = np.ndarray((tam_lote, 3, tam, tam), dtype=np.float32, buffer=mem_entrada.buf)
+    salida = np.ndarray((tam_lote, tam * tam + 1), dtype=np.float32, buffer=mem_salida.buf)
+    try:
+        while True:
+            n = conexion.recv()
+            if n is None:
+                break
+            politica, valor = inferir(entrada[:n])
+            salida[:n, :-1] = politica
+            salida[:n, -1] = np.reshape(valor, n)
+            conexion.send(n)
+    finally:
+        # Los arreglos deben soltarse antes de cerrar la memoria compartida
+        del entrada, salida
+        mem_entrada.close()
+        mem_salida.close()
+
+def _liberar_red(proceso, conexion, memorias):
+    """Detiene el proceso evaluador (si sigue vivo) y libera la memoria compartida"""
+    try:
+        if proceso.is_alive():
+            conexion.send(None)
+    except OSError:
+        pass
+    proceso.join(timeout=5)
+    if proceso.is_alive():
+        proceso.terminate()
+        proceso.join()
+    conexion.close()
+    for mem in memorias:
+        try:
+            mem.close()
+        except BufferError:
+            pass  # Quedan arreglos sobre el buffer; la memoria se suelta con ellos
+        mem.unlink()
+
+class EvaluadorRed(Evaluador):
+    """Evaluador con una red pequeña en CPU que corre en un proceso aparte.
+
+    El modelo es un .npz (W1, b1, Wp, bp, Wv, bv) o un .onnx para onnxruntime.
+    Entrada (N, 3, tam, tam) float32: fichas propias, rivales y casillas vacías,
+    en el marco canónico donde siempre mueve el jugador 1 (horizontal).
+    Salidas: logits de política (N, tam*tam) y valor (N, 1) en [0, 1].
+    Los resultados se guardan por hash canónico, así que las posiciones
+    simétricas comparten entrada.
+
+    El constructor espera a que el proceso cargue y valide el modelo
+    (ValueError si falla). Si el proceso muere después, o un lote tarda más
+    de tiempo_respuesta (el evaluador se cierra entonces), evaluar() lanza
+    EvaluadorCaido. La memoria compartida se libera con cerrar(), al salir
+    del `with` o, en último caso, cuando el objeto se recolecta.
+    """
+    def __init__(self, tam: int, ruta_modelo: str, tam_lote: int = 16, max_cache: int = 100000,
+                 tiempo_carga: float = 60.0, tiempo_respuesta: float = 5.0):
+        if np is None:
+            raise ImportError("EvaluadorRed necesita numpy")
+        super().__init__(tam, tam_lote)
+        self.max_cache = max_cache
+        self.cache = {}
+        # Espera máxima por lote; un proceso colgado no debe agotar el tiempo de jugada
+        self.tiempo_respuesta = tiempo_respuesta
+
+        celdas = tam * tam
+        self._mem_entrada = shared_memory.SharedMemory(create=True, size=tam_lote * 3 * celdas * 4)
+        self._mem_salida = shared_memory.SharedMemory(create=True, size=tam_lote * (celdas + 1) * 4)
+        self._entrada = np.ndarray((tam_lote, 3, tam, tam), dtype=np.float32, buffer=self._mem_entrada.buf)
+        self._salida = np.ndarray((tam_lote, celdas + 1), dtype=np.float32, buffer=self._mem_salida.buf)
+
+        self._conexion, extremo = mp.Pipe()
+        self._proceso = mp.Process(
+            target=_servidor_red,
+            args=(self._mem_entrada.name, self._mem_salida.name, tam, tam_lote, ruta_modelo, extremo),
+            daemon=True)
+        self._proceso.start()
+        extremo.close()
+        self._finalizador = weakref.finalize(
+            self, _liberar_red, self._proceso, self._conexion, (self._mem_entrada, self._mem_salida))
+
+        # El modelo se carga en el proceso evaluador; se espera su respuesta
+        try:
+            if not self._conexion.poll(tiempo_carga):
+                raise TimeoutError(f"el modelo no cargó en {tiempo_carga} s")
+            estado, mensaje = self._conexion.recv()
+        except (EOFError, OSError, TimeoutError) as error:
+            estado, mensaje = 'error', f"{type(error).__name__}: {error}"
+        if estado != 'ok':
+            self.cerrar()
+            raise ValueError(f"No se pudo cargar el modelo {ruta_modelo}: {mensaje}")
+
+    def evaluar(self, posiciones) -> list:
+        if not self._finalizador.alive:
+            raise EvaluadorCaido("El evaluador está cerrado")
+        if len(self.cache) >= self.max_cache:
+            self.cache.clear()
+
+        canonicas = [hash_canonico(tablero.board, jugador) for tablero, jugador in posiciones]
+        # Sin repetir posiciones ya evaluadas o duplicadas dentro del lote
+        pendientes = {}
+        for (clave, simetria), (tablero, jugador) in zip(canonicas, posiciones):
+            if clave not in self.cache and clave not in pendientes:
+                pendientes[clave] = _clave_transformada(tablero.board, jugador, simetria)[1]
+        pendientes = list(pendientes.items())
+        for i in range(0, len(pendientes), self.tam_lote):
+            self._evaluar_lote(pendientes[i:i + self.tam_lote])
+
+        resultados = []
+        for clave, simetria in canonicas:
+            probs, valor = self.cache[clave]
+            politica = {transformar_casilla(divmod(int(j), self.tam), simetria, self.tam): float(probs[j])
+                        for j in np.flatnonzero(probs)}
+            resultados.append((politica, valor))
+        return resultados
+
+    def _evaluar_lote(self, claves):
+        """Envía un lote de (hash, casillas canónicas) al proceso evaluador"""
+        celdas = self.tam * self.tam
+        for i, (_, planas) in enumerate(claves):
+            fichas = np.asarray(planas, dtype=np.int8).reshape(self.tam, self.tam)
+            self._entrada[i, 0] = fichas == 1
+            self._entrada[i, 1] = fichas == 2
+            self._entrada[i, 2] = fichas == 0
+
+        try:
+            self._conexion.send(len(claves))
+            if not self._conexion.poll(self.tiempo_respuesta):
+                # Proceso colgado: se mata ya, sin esperar a que atienda el cierre
+                self._proceso.kill()
+                self.cerrar()
+                raise EvaluadorCaido(f"El evaluador no respondió en {self.tiempo_respuesta} s")
+            self._conexion.recv()
+        except (EOFError, OSError) as error:
+            raise EvaluadorCaido("El proceso evaluador terminó") from error
+
+        for i, (clave, planas) in enumerate(claves):
+            libres = [j for j, v in enumerate(planas) if v == 0]
+            # Política como arreglo compacto por casilla (0 en las ocupadas)
+            probs = np.zeros(celdas, dtype=np.float32)
+            if libres:
+                # Softmax sólo sobre las casillas libres
+                logits = self._salida[i, libres]
+                exps = np.exp(logits - logits.max())
+                probs[libres] = exps / exps.sum()
+            self.cache[clave] = (probs, float(self._salida[i, celdas]))
+
+    def cerrar(self):
+        """Detiene el proceso evaluador y libera la memoria compartida"""
+        # Los arreglos deben soltarse antes de cerrar la memoria compartida
+        self._entrada = self._salida = None
+        self._finalizador()
+
+class EstadoPartida:
+    """Tablero de la partida con fichas, grupos (union-find) y hashes al día"""
+    def __init__(self, tam: int):
+        self.tam = tam
+        self.tablero = HexBoard(tam)
+        self.fichas = {1: set(), 2: set()}
+        # Union-find sobre las casillas más dos bordes virtuales por jugador
+        celdas = tam * tam
+        self._padre = list(range(celdas + 4))
+        self._bordes = {1: (celdas, celdas + 1), 2: (celdas + 2, celdas + 3)}
+        # Hash Zobrist de la posición vista bajo cada simetría, al día con cada ficha
+        self._hashes = [_tabla_zobrist(tam)[0]] * len(SIMETRIAS)
+
+    @property
+    def num_fichas(self) -> int:
+        return len(self.fichas[1]) + len(self.fichas[2])
+
+    def turno(self) -> int:
+        """Jugador al que le toca, suponiendo turnos alternos empezando por el 1"""
+        return 1 if self.num_fichas % 2 == 0 else 2
+
+    def _raiz(self, i):
+        while self._padre[i] != i:
+            self._padre[i] = self._padre[self._padre[i]]  # Compresión por saltos
+            i = self._padre[i]
+        return i
+
+    def _grupos_vecinos(self, casilla, jugador) -> set:
+        """Raíces de los grupos y bordes de jugador que tocan la casilla"""
+        r, c = casilla
+        tam = self.tam
+        raices = set()
+        for dr, dc in DIRS:
+            nr, nc = r + dr, c + dc
+            if 0 <= nr < tam and 0 <= nc < tam and self.tablero.board[nr][nc] == jugador:
+                raices.add(self._raiz(nr * tam + nc))
+        inicio, fin = self._bordes[jugador]
+        linea = c if jugador == 1 else r  # El 1 conecta izquierda-derecha
+        if linea == 0:
+            raices.add(self._raiz(inicio))
+        if linea == tam - 1:
+            raices.add(self._raiz(fin))
+        return raices
+
+    def colocar(self, casilla, jugador):
+        """Coloca una ficha y actualiza fichas, grupos y claves.
+
+        Lanza ValueError si la casilla está fuera del tablero u ocupada.
+        """
+        r, c = casilla
+        if not (0 <= r < self.tam and 0 <= c < self.tam):
+            raise ValueError(f"Casilla {casilla} fuera del tablero de {self.tam}x{self.tam}")
+        if self.tablero.board[r][c] != 0:
+            raise ValueError(f"Casilla {casilla} ya ocupada")
+        raices = self._grupos_vecinos(casilla, jugador)
+        self.tablero.place_piece(r, c, jugador)
+        self.fichas[jugador].add(casilla)
+        nueva = r * self.tam + c
+        for raiz in raices:
+            self._padre[raiz] = nueva
+        for s in SIMETRIAS:
+            self._hashes[s] ^= codigo_zobrist(casilla, jugador, s, self.tam)
+
+    def jugadas_ganadoras(self, jugador) -> list:
+        """Casillas libres que unen ya los dos bordes de jugador"""
+        inicio, fin = self._bordes[jugador]
+        tam = self.tam
+        vistas = set()
+        ganadoras = []
+        # Una jugada ganadora siempre toca alguna ficha propia
+        for r, c in self.fichas[jugador]:
+            for dr, dc in DIRS:
+                nr, nc = r + dr, c + dc
+                if 0 <= nr < tam and 0 <= nc < tam and self.tablero.board[nr][nc] == 0 \
+                        and (nr, nc) not in vistas:
+                    vistas.add((nr, nc))
+                    raices = self._grupos_vecinos((nr, nc), jugador)
+                    if self._raiz(inicio) in raices and self._raiz(fin) in raices:
+                        ganadoras.append((nr, nc))
+        return sorted(ganadoras)
+
+    def clave(self, jugador):
+        """hash_canonico de la posición actual, sin recorrer el tablero"""
+        return min((self._hashes[s], s) for s in simetrias_turno(jugador))
+
+    def clave_tras(self, casilla, color, jugador):
+        """hash_canonico que tendría la posición tras colocar una ficha"""
+        return min((self._hashes[s] ^ codigo_zobrist(casilla, color, s, self.tam), s)
+                   for s in simetrias_turno(jugador))
+
 class HexPlayer(Player):
-    def __init__(self, player_id: int):
+    def __init__(self, player_id: int, evaluador: Evaluador = None):
         super().__init__(player_id)
+        # Evaluador opcional de hojas (p. ej. EvaluadorRed); sin él se usan simulaciones.
+        # Lo cierra quien lo creó; si deja de responder se vuelve a las simulaciones.
+        self.evaluador = evaluador
         self.tiempo_limite = 10  # Un poco menos para evitar timeouts
+        # Parámetros de selección: exploración PUCT y sesgo AMAF de RAVE
+        self.c_puct = C_PUCT
+        self.sesgo_rave = SESGO_RAVE
         self.oponente = 3 - player_id
         self.libro_aperturas = self._crear_libro_aperturas()
         self.patrones_observados = []  # Para seguimiento de jugadas del oponente
-        
+        # Costos A* por posición canónica (comparten entrada las simétricas)
+        self.cache_evaluaciones = {}
+        self.max_cache_evaluaciones = 100000
+        # Estado incremental de la partida (new_game / apply_move / play)
+        self.estado = None
+
+    def new_game(self, size: int):
+        """Empieza una partida con estado interno incremental"""
+        self.estado = EstadoPartida(size)
+
+    def apply_move(self, move: tuple):
+        """Registra la jugada del oponente; las nuestras ya las registra play().
+
+        Lanza ValueError sin partida empezada o si la casilla no está libre.
+        """
+        if self.estado is None:
+            raise ValueError("Llama a new_game() antes de apply_move()")
+        self.estado.colocar(move, self.estado.turno())
+
+    def _sincronizar(self, tablero: HexBoard):
+        """Lleva el estado interno al tablero recibido aplicando sólo las diferencias"""
+        if self.estado is None or self.estado.tam != tablero.size:
+            self.new_game(tablero.size)
+        actual = self.estado.tablero.board
+        nuevas = []
+        for r, fila in enumerate(tablero.board):
+            for c, valor in enumerate(fila):
+                if valor != actual[r][c]:
+                    if actual[r][c] != 0:
+                        # Falta una ficha conocida: es otra partida, se reconstruye
+                        self.new_game(tablero.size)
+                        return self._sincronizar(tablero)
+                    nuevas.append(((r, c), valor))
+        for casilla, valor in nuevas:
+            self.estado.colocar(casilla, valor)
+
+    def _es_tablero_partida(self, tablero) -> bool:
+        return self.estado is not None and tablero is self.estado.tablero
+
+    def _clave(self, tablero, jugador):
+        """Hash canónico; el estado lo memoriza si es el tablero de la partida"""
+        if self._es_tablero_partida(tablero):
+            return self.estado.clave(jugador)
+        return hash_canonico(tablero.board, jugador)
+
+    def _fichas(self, tablero, jugador):
+        """Fichas de jugador; sin recorrer el tablero si es el de la partida"""
+        if self._es_tablero_partida(tablero):
+            return self.estado.fichas[jugador]
+        return [(r, c) for r in range(tablero.size) for c in range(tablero.size)
+                if tablero.board[r][c] == jugador]
+
+    @staticmethod
+    def _agregar_apertura(libro, celdas, jugador, jugada):
+        """Guarda una jugada del libro en el marco de la posición canónica"""
+        clave, simetria = hash_canonico(celdas, jugador)
+        libro[clave] = transformar_casilla(jugada, simetria, len(celdas))
+
     def _crear_libro_aperturas(self):
         """Crea un pequeño libro de aperturas para las primeras jugadas"""
         libro = {}
         # Para tablero estándar (11x11)
         # Primera jugada: centro ligeramente desplazado
-        libro[(11, 0)] = (5, 5)
+        self._agregar_apertura(libro, [[0] * 11 for _ in range(11)], 1, (5, 5))
         
         # Para tablero pequeño (7x7)
-        libro[(7, 0)] = (3, 3)  
+        self._agregar_apertura(libro, [[0] * 7 for _ in range(7)], 1, (3, 3))
         
         return libro
+
+    def _consultar_libro(self, tablero: HexBoard):
+        """Busca la posición (o una simétrica) en el libro de aperturas"""
+        clave, simetria = self._clave(tablero, self.player_id)
+        jugada = self.libro_aperturas.get(clave)
+        if jugada is None:
+            return None
+        return transformar_casilla(jugada, simetria, tablero.size)
         
+    def _contar_fichas(self, tablero: HexBoard) -> int:
+        if self._es_tablero_partida(tablero):
+            return self.estado.num_fichas
+        return sum(1 for fila in tablero.board for c in fila if c != 0)
+
     def _es_primera_jugada(self, tablero: HexBoard) -> bool:
         """Retorna True si el tablero está vacío"""
-        return all(c == 0 for fila in tablero.board for c in fila)
+        return self._contar_fichas(tablero) == 0
     
     def _es_segunda_jugada(self, tablero: HexBoard) -> bool:
         """Retorna True si sólo hay una ficha en el tablero"""
-        fichas = sum(1 for fila in tablero.board for c in fila if c != 0)
-        return fichas == 1
+        return self._contar_fichas(tablero) == 1
         
     def _obtener_fichas_oponente(self, tablero: HexBoard) -> list:
         """Encuentra todas las posiciones de las fichas del oponente"""
-        fichas = []
-        for r in range(tablero.size):
-            for c in range(tablero.size):
-                if tablero.board[r][c] == self.oponente:
-                    fichas.append((r, c))
-        return fichas
+        return sorted(self._fichas(tablero, self.oponente))
 
     def _detectar_linea_horizontal(self, tablero: HexBoard, jugador: int) -> list:
         """Detecta si hay una línea horizontal formándose"""
@@ -365,16 +975,17 @@ class HexPlayer(Player):
         return amenazas
         
     def busqueda_a_estrella(self, tablero, jugador):
-        """Implementa A* para encontrar camino más corto entre bordes"""
+        """Implementa A* para encontrar camino más corto entre bordes.
+
+        Sin heurística (es Dijkstra): las casillas propias cuestan 0, así que
+        cualquier estimación positiva puede sobrestimar y dar un costo no óptimo
+        que además cambiaría entre posiciones simétricas.
+        """
         tam = tablero.size
         visitados = set()
         cola = []
         costos = {}
         
-        def heuristica(fila, col):
-            # Distancia Manhattan al borde opuesto
-            return tam - 1 - (col if jugador == 1 else fila)
-        
         def es_meta(fila, col):
             # Llegamos al lado opuesto?
             return (col == tam - 1) if jugador == 1 else (fila == tam - 1)
@@ -389,9 +1000,9 @@ class HexPlayer(Player):
             elif celda == 0:
                 costo = 1  # Casilla vacía: coste 1
             else:
-                continue  # Casilla enemiga: no usamos
+                costo = 1000  # Casilla enemiga: igual que en el resto del tablero
             
-            heapq.heappush(cola, (costo + heuristica(fila, col), costo, fila, col))
+            heapq.heappush(cola, (costo, costo, fila, col))
             costos[(fila, col)] = costo
         
         # Búsqueda A*
@@ -418,14 +1029,42 @@ class HexPlayer(Player):
                         
                     if (nf, nc) not in costos or nuevo_costo < costos[(nf, nc)]:
                         costos[(nf, nc)] = nuevo_costo
-                        prioridad = nuevo_costo + heuristica(nf, nc)
-                        heapq.heappush(cola, (prioridad, nuevo_costo, nf, nc))
+                        heapq.heappush(cola, (nuevo_costo, nuevo_costo, nf, nc))
         
         return float('inf')  # No hay camino
+
+    def _costo_camino(self, tablero, jugador):
+        """Costo A* con cache compartida entre posiciones simétricas"""
+        clave, _ = self._clave(tablero, jugador)
+        costo = self.cache_evaluaciones.get(clave)
+        if costo is None:
+            costo = self.busqueda_a_estrella(tablero, jugador)
+            if len(self.cache_evaluaciones) >= self.max_cache_evaluaciones:
+                self.cache_evaluaciones.clear()
+            self.cache_evaluaciones[clave] = costo
+        return costo
     
+    def _costo_tras_jugada(self, tablero, jugada, jugador):
+        """Costo A* de jugador si jugamos jugada; sólo clona si no está en cache"""
+        if self._es_tablero_partida(tablero):
+            clave, _ = self.estado.clave_tras(jugada, self.player_id, jugador)
+            costo = self.cache_evaluaciones.get(clave)
+            if costo is not None:
+                return costo
+        tablero_temp = tablero.clone()
+        tablero_temp.place_piece(*jugada, self.player_id)
+        return self._costo_camino(tablero_temp, jugador)
+
     def detectar_jugadas_criticas(self, tablero):
         """Detecta jugadas críticas ofensivas y defensivas"""
         jugadas_criticas = []
+
+        # Victorias inmediatas (propias o del rival) con los grupos del estado
+        if self._es_tablero_partida(tablero):
+            for jugada in self.estado.jugadas_ganadoras(self.player_id):
+                jugadas_criticas.append((jugada, 1000))
+            for jugada in self.estado.jugadas_ganadoras(self.oponente):
+                jugadas_criticas.append((jugada, 900))
         
         # Detectar amenazas lineales
         amenazas_h = self._detectar_linea_horizontal(tablero, self.oponente)
@@ -439,16 +1078,14 @@ class HexPlayer(Player):
         todas_amenazas.extend(amenazas_patron)
         
         # Análisis tradicional con A*
-        mi_costo = self.busqueda_a_estrella(tablero, self.player_id)
-        costo_rival = self.busqueda_a_estrella(tablero, self.oponente)
+        mi_costo = self._costo_camino(tablero, self.player_id)
+        costo_rival = self._costo_camino(tablero, self.oponente)
         
         # ¿El oponente está cerca de ganar?
         if costo_rival <= 3:
             # Busca jugadas defensivas que bloqueen
             for jugada in tablero.get_possible_moves():
-                tablero_temp = tablero.clone()
-                tablero_temp.place_piece(*jugada, self.player_id)
-                nuevo_costo_rival = self.busqueda_a_estrella(tablero_temp, self.oponente)
+                nuevo_costo_rival = self._costo_tras_jugada(tablero, jugada, self.oponente)
                 if nuevo_costo_rival > costo_rival:
                     prioridad = 150 + (nuevo_costo_rival - costo_rival) * 20
                     jugadas_criticas.append((jugada, prioridad))
@@ -456,9 +1093,7 @@ class HexPlayer(Player):
         # ¿Estamos cerca de ganar?
         if mi_costo <= 3:
             for jugada in tablero.get_possible_moves():
-                tablero_temp = tablero.clone()
-                tablero_temp.place_piece(*jugada, self.player_id)
-                nuevo_mi_costo = self.busqueda_a_estrella(tablero_temp, self.player_id)
+                nuevo_mi_costo = self._costo_tras_jugada(tablero, jugada, self.player_id)
                 if nuevo_mi_costo < mi_costo:
                     prioridad = 200 + (mi_costo - nuevo_mi_costo) * 30
                     jugadas_criticas.append((jugada, prioridad))
@@ -483,35 +1118,34 @@ class HexPlayer(Player):
             [(0,-1), (-1,0)]
         ]
         
-        for r in range(tam):
-            for c in range(tam):
-                if tablero.board[r][c] == self.player_id:
-                    # Busca patrones de puente desde esta celda
-                    for patron in patrones:
-                        # Verifica las dos direcciones del patrón
-                        celdas_puente = []
-                        valido = True
-                        
-                        for dr, dc in patron:
-                            nr, nc = r + dr, c + dc
-                            if 0 <= nr < tam and 0 <= nc < tam:
-                                if tablero.board[nr][nc] == 0:
-                                    celdas_puente.append((nr, nc))
-                                else:
-                                    valido = False
-                                    break
-                            else:
-                                valido = False
-                                break
-                        
-                        # Verifica que la celda diagonal también sea propia
-                        if valido and len(celdas_puente) == 2:
-                            dr_total = patron[0][0] + patron[1][0]
-                            dc_total = patron[0][1] + patron[1][1]
-                            nr, nc = r + dr_total, c + dc_total
-                            
-                            if 0 <= nr < tam and 0 <= nc < tam and tablero.board[nr][nc] == self.player_id:
-                                puentes.append(celdas_puente)
+        # Sólo hace falta mirar desde las fichas propias
+        for r, c in sorted(self._fichas(tablero, self.player_id)):
+            # Busca patrones de puente desde esta celda
+            for patron in patrones:
+                # Verifica las dos direcciones del patrón
+                celdas_puente = []
+                valido = True
+                
+                for dr, dc in patron:
+                    nr, nc = r + dr, c + dc
+                    if 0 <= nr < tam and 0 <= nc < tam:
+                        if tablero.board[nr][nc] == 0:
+                            celdas_puente.append((nr, nc))
+                        else:
+                            valido = False
+                            break
+                    else:
+                        valido = False
+                        break
+                
+                # Verifica que la celda diagonal también sea propia
+                if valido and len(celdas_puente) == 2:
+                    dr_total = patron[0][0] + patron[1][0]
+                    dc_total = patron[0][1] + patron[1][1]
+                    nr, nc = r + dr_total, c + dc_total
+                    
+                    if 0 <= nr < tam and 0 <= nc < tam and tablero.board[nr][nc] == self.player_id:
+                        puentes.append(celdas_puente)
         
         return puentes
     
@@ -585,8 +1219,8 @@ class HexPlayer(Player):
         mejor_puntuacion = float('-inf')
         
         # Verificar si es mejor atacar o defender
-        mi_costo = self.busqueda_a_estrella(tablero, self.player_id)
-        costo_rival = self.busqueda_a_estrella(tablero, self.oponente)
+        mi_costo = self._costo_camino(tablero, self.player_id)
+        costo_rival = self._costo_camino(tablero, self.oponente)
         
         modo_ataque = mi_costo <= costo_rival
         
@@ -612,16 +1246,13 @@ class HexPlayer(Player):
                         puntos += 5  # Alta prioridad a conectar con piezas propias
             
             # Valor estratégico (simulación rápida)
-            tablero_temp = tablero.clone()
-            tablero_temp.place_piece(fila, col, self.player_id)
-            
             if modo_ataque:
                 # En modo ataque, valorar nuestro avance
-                nuevo_costo = self.busqueda_a_estrella(tablero_temp, self.player_id)
+                nuevo_costo = self._costo_tras_jugada(tablero, jugada, self.player_id)
                 puntos += (mi_costo - nuevo_costo) * 10  # Bonus por reducir nuestro camino
             else:
                 # En modo defensa, valorar bloquear al oponente
-                nuevo_costo_rival = self.busqueda_a_estrella(tablero_temp, self.oponente)
+                nuevo_costo_rival = self._costo_tras_jugada(tablero, jugada, self.oponente)
                 puntos += (nuevo_costo_rival - costo_rival) * 8  # Bonus por alargar camino rival
             
             if puntos > mejor_puntuacion:
@@ -630,14 +1261,84 @@ class HexPlayer(Player):
         
         return mejor_jugada
                 
-    def play(self, tablero: HexBoard) -> tuple:
+    def _crear_raiz(self, tablero, jugadas_criticas):
+        """Raíz del árbol MCTS con las jugadas críticas como AMAF previo"""
+        # El árbol nunca modifica el tablero de la raíz, no hace falta clonarlo
+        raiz = Node(tablero, None, None, self.player_id)
+        
+        # Inyectar conocimiento sobre jugadas críticas en el árbol MCTS
+        if jugadas_criticas:
+            # Inicializar valores AMAF para jugadas críticas
+            for jugada, prioridad in jugadas_criticas:
+                valor_normalizado = min(1.0, prioridad / 300.0)  # Normalizar a [0,1]
+                raiz.seed_amaf(jugada, valor_normalizado * 10, 10)  # Simular visitas previas
+        return raiz
+
+    @staticmethod
+    def _es_terminal(nodo) -> bool:
+        return nodo.board.check_connection(1) or nodo.board.check_connection(2)
+
+    def _mcts_por_lotes(self, raiz, tiempo_inicio, tiempo_restante):
+        """MCTS (PUCT) que acumula hojas y las evalúa en un solo lote"""
+        [(politica, _)] = self.evaluador.evaluar([(raiz.board, raiz.player_id)])
+        raiz.set_policy(politica)
+        iteraciones = 0
+
+        while time.time() - tiempo_inicio < tiempo_restante:
+            hojas = []
+            for _ in range(self.evaluador.tam_lote):
+                nodo = raiz.select(self.c_puct, self.sesgo_rave)
+                if nodo.pending:
+                    # El descenso llegó a una hoja del lote: se evalúa lo acumulado
+                    break
+                iteraciones += 1
+                if not self._es_terminal(nodo):
+                    nodo = nodo.expand()
+                if self._es_terminal(nodo):
+                    # Partida acabada (también si la acaba la jugada recién expandida):
+                    # resultado exacto en lugar del valor de la red
+                    resultado, jugadas = nodo.simulate()
+                    nodo.backpropagate(resultado, jugadas)
+                    continue
+                # Pérdida virtual para que los demás descensos del lote vayan a otras ramas
+                nodo.add_virtual_loss(1)
+                nodo.pending = True
+                hojas.append(nodo)
+
+            if hojas:
+                resultados = self.evaluador.evaluar([(h.board, h.player_id) for h in hojas])
+                for hoja, (politica, valor) in zip(hojas, resultados):
+                    hoja.add_virtual_loss(-1)
+                    hoja.pending = False
+                    hoja.set_policy(politica)
+                    hoja.backpropagate(valor, [])
+
+        return iteraciones
+
+    def play(self, tablero: HexBoard = None) -> tuple:
+        """Elige y registra nuestra jugada.
+
+        Con tablero, el estado interno se sincroniza con él por diferencias;
+        sin tablero se juega sobre el estado llevado con new_game/apply_move.
+        """
+        if tablero is not None:
+            self._sincronizar(tablero)
+        elif self.estado is None:
+            raise ValueError("Llama a new_game() antes de play() sin tablero")
+
+        jugada = self._elegir_jugada(self.estado.tablero)
+        self.estado.colocar(jugada, self.player_id)
+        return jugada
+
+    def _elegir_jugada(self, tablero: HexBoard) -> tuple:
         # Verificar tiempo de inicio para evitar timeouts
         tiempo_inicio = time.time()
         
-        # Jugada inicial según libro de aperturas
+        # Jugada según libro de aperturas (también en posiciones simétricas)
+        jugada_libro = self._consultar_libro(tablero)
+        if jugada_libro is not None:
+            return jugada_libro
         if self._es_primera_jugada(tablero):
-            if (tablero.size, 0) in self.libro_aperturas:
-                return self.libro_aperturas[(tablero.size, 0)]
             # Sin apertura en libro: centro
             return (tablero.size // 2, tablero.size // 2)
             
@@ -672,24 +1373,26 @@ class HexPlayer(Player):
             return self._evaluar_jugada_estrategica(tablero)
         
         # Si hay tiempo suficiente, usar MCTS con AMAF mejorado
-        raiz = Node(tablero.clone(), None, None, self.player_id)
+        raiz = self._crear_raiz(tablero, jugadas_criticas)
         iteraciones = 0
         
-        # Inyectar conocimiento sobre jugadas críticas en el árbol MCTS
-        if jugadas_criticas:
-            # Inicializar valores AMAF para jugadas críticas
-            for jugada, prioridad in jugadas_criticas:
-                valor_normalizado = min(1.0, prioridad / 300.0)  # Normalizar a [0,1]
-                raiz.amaf_stats[jugada] = (valor_normalizado * 10, 10)  # Simular visitas previas
-        
+        # Con evaluador: hojas evaluadas por lotes en lugar de simulaciones
+        if self.evaluador is not None and self.evaluador.tam == tablero.size:
+            try:
+                iteraciones = self._mcts_por_lotes(raiz, tiempo_inicio, tiempo_restante)
+            except EvaluadorCaido:
+                # Se deja el evaluador y el árbol a medio evaluar; siguen las simulaciones
+                self.evaluador = None
+                raiz = self._crear_raiz(tablero, jugadas_criticas)
+
         # Ejecuta MCTS hasta agotar tiempo
         while time.time() - tiempo_inicio < tiempo_restante:
-            nodo = raiz.select()
-            # Si no es estado terminal
+            nodo = raiz.select(self.c_puct, self.sesgo_rave)
+            # Si no es estado terminal se expande; si lo es, la simulación es inmediata
             if not nodo.board.check_connection(1) and not nodo.board.check_connection(2):
                 nodo = nodo.expand()
-                resultado, jugadas = nodo.simulate()
-                nodo.backpropagate(resultado, jugadas)
+            resultado, jugadas = nodo.simulate()
+            nodo.backpropagate(resultado, jugadas)
             iteraciones += 1
         
         mejor = raiz.best_child()